@@ -3,8 +3,10 @@ An auto-merger of merge requests for GitLab
 """
 
 import contextlib
+import functools
 import logging
 import re
+import signal
 import sys
 import tempfile
 from datetime import timedelta
@@ -32,11 +34,16 @@ def time_interval(str_interval):
         ) from err
 
 
+@functools.lru_cache(maxsize=32)
+def _compiled_regexp(str_regex):
+    return re.compile(str_regex)
+
+
 def _parse_config(args):
 
     def regexp(str_regex):
         try:
-            return re.compile(str_regex)
+            return _compiled_regexp(str_regex)
         except re.error as err:
             raise configargparse.ArgumentTypeError('Invalid regexp: %r (%s)' % (str_regex, err.msg))
 
@@ -193,6 +200,16 @@ def _parse_config(args):
         default=None,
         help='A reference repo to be used when git cloning.\n'
     )
+    parser.add_argument(
+        '--repo-cache-dir',
+        type=str,
+        default=None,
+        metavar='DIR',
+        help=(
+            'Keep clones of the repos in this directory, so they can be reused (and just fetched)\n'
+            'after a restart, instead of cloning into a fresh temporary directory every time.\n'
+        ),
+    )
     parser.add_argument(
         '--branch-regexp',
         type=regexp,
@@ -260,7 +277,17 @@ def _parse_config(args):
 
 @contextlib.contextmanager
 def _secret_auth_token_and_ssh_key(options):
-    auth_token = options.auth_token or options.auth_token_file.readline().strip()
+    if options.auth_token_file:
+        # no need to keep the file (and so the secret) around once we've read it
+        with options.auth_token_file as auth_token_file:
+            auth_token = auth_token_file.readline()
+    else:
+        auth_token = options.auth_token
+    auth_token = auth_token.strip()
+    if not auth_token:
+        raise MargeBotCliArgError('The GitLab auth token is empty.')
+    if not (options.ssh_key_file or options.ssh_key):
+        raise MargeBotCliArgError('The ssh key is empty.')
     if options.ssh_key_file:
         yield auth_token, options.ssh_key_file
     else:
@@ -273,6 +300,14 @@ def _secret_auth_token_and_ssh_key(options):
                 tmp_ssh_key_file.close()
 
 
+def _stop_on_sigterm(marge_bot, _signum, _frame):
+    # don't die mid-merge: stop once we're no longer pushing or merging, giving up on any waits,
+    # and let a second SIGTERM kill us right away for whoever can't wait that long
+    logging.warning('Got SIGTERM, stopping... (send it again to quit immediately)')
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    marge_bot.stop()
+
+
 def main(args=None):
     if args is None:
         args = sys.argv[1:]
@@ -317,6 +352,7 @@ def main(args=None):
             project_regexp=options.project_regexp,
             git_timeout=options.git_timeout,
             git_reference_repo=options.git_reference_repo,
+            repo_cache_dir=options.repo_cache_dir,
             branch_regexp=options.branch_regexp,
             source_branch_regexp=options.source_branch_regexp,
             merge_order=options.merge_order,
@@ -338,4 +374,5 @@ def main(args=None):
         )
 
         marge_bot = bot.Bot(api=api, config=config)
+        signal.signal(signal.SIGTERM, functools.partial(_stop_on_sigterm, marge_bot))
         marge_bot.start()
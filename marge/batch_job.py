@@ -17,8 +17,8 @@ class CannotBatch(Exception):
 class BatchMergeJob(MergeJob):
     BATCH_BRANCH_NAME = 'marge_bot_batch_merge_job'
 
-    def __init__(self, *, api, user, project, repo, options, merge_requests):
-        super().__init__(api=api, user=user, project=project, repo=repo, options=options)
+    def __init__(self, *, api, user, project, repo, options, merge_requests, stop=None):
+        super().__init__(api=api, user=user, project=project, repo=repo, options=options, stop=stop)
         self._merge_requests = merge_requests
 
     def remove_batch_branch(self):
@@ -294,6 +294,9 @@ class BatchMergeJob(MergeJob):
         if self._project.only_allow_merge_if_pipeline_succeeds:
             try:
                 self.wait_for_ci_to_pass(batch_mr, commit_sha=batch_mr_sha)
+            except SkipMerge as err:
+                # e.g. we're shutting down; nothing failed, the batch will be retried next time
+                raise CannotBatch(err.reason) from err
             except CannotMerge as err:
                 for merge_request in working_merge_requests:
                     merge_request.comment(
@@ -1,6 +1,9 @@
 import logging as log
+import os
+import threading
 import time
 from collections import namedtuple
+from datetime import datetime, timedelta
 from tempfile import TemporaryDirectory
 
 from . import batch_job
@@ -13,11 +16,37 @@ from .project import AccessLevel, Project
 
 MergeRequest = merge_request_module.MergeRequest
 
+# needed to browse merge requests
+_MIN_ACCESS_LEVEL = AccessLevel.reporter.value
+
 
 class Bot:
+    __slots__ = (
+        '_api',
+        '_config',
+        '_polling_interval_in_secs',
+        '_projects',
+        '_projects_fetched_at',
+        '_project_match',
+        '_stop',
+    )
+
+    MIN_POLLING_INTERVAL_IN_SECS = 5
+    MAX_POLLING_INTERVAL_IN_SECS = 300
+    POLLING_SPEEDUP_FACTOR = 0.6
+    POLLING_BACKOFF_FACTOR = 1.5
+    PROJECTS_CACHE_TTL_IN_SECS = 300
+    MAX_EMBARGO_SLEEP = timedelta(hours=1)
+
     def __init__(self, *, api, config):
         self._api = api
         self._config = config
+        self._polling_interval_in_secs = 30
+        self._projects = None
+        self._projects_fetched_at = None
+        # `match` (rather than `fullmatch`) is what makes e.g. '(?!exclude/me)' work
+        self._project_match = config.project_regexp.match
+        self._stop = threading.Event()
 
         user = config.user
         opts = config.merge_opts
@@ -31,15 +60,23 @@ class Bot:
             )
 
     def start(self):
-        with TemporaryDirectory() as root_dir:
-            repo_manager = store.RepoManager(
-                user=self.user,
-                root_dir=root_dir,
-                ssh_key_file=self._config.ssh_key_file,
-                timeout=self._config.git_timeout,
-                reference=self._config.git_reference_repo,
-            )
-            self._run(repo_manager)
+        repo_cache_dir = self._config.repo_cache_dir
+        if repo_cache_dir:
+            os.makedirs(repo_cache_dir, exist_ok=True)
+            self._run(self._repo_manager(repo_cache_dir, persistent=True))
+        else:
+            with TemporaryDirectory() as root_dir:
+                self._run(self._repo_manager(root_dir))
+
+    def _repo_manager(self, root_dir, persistent=False):
+        return store.RepoManager(
+            user=self.user,
+            root_dir=root_dir,
+            ssh_key_file=self._config.ssh_key_file,
+            timeout=self._config.git_timeout,
+            reference=self._config.git_reference_repo,
+            persistent=persistent,
+        )
 
     @property
     def user(self):
@@ -51,10 +88,21 @@ class Bot:
 
     def _run(self, repo_manager):
         time_to_sleep_between_projects_in_secs = 1
-        min_time_to_sleep_after_iterating_all_projects_in_secs = 30
-        while True:
-            projects = self._get_projects()
-            self._process_projects(
+        found_merge_requests = False
+        while not self._stop.is_set():
+            time_until_embargo_ends = self._time_until_embargo_ends()
+            if time_until_embargo_ends:
+                if self._config.cli:
+                    log.info('Merge embargo! Nothing to do...')
+                    return
+                embargo_sleep = min(time_until_embargo_ends, self.MAX_EMBARGO_SLEEP)
+                log.info('Merge embargo! Sleeping for %s...', embargo_sleep)
+                self._stop.wait(embargo_sleep.total_seconds())
+                continue
+
+            # activity suggests projects may be changing too, so don't trust the cache
+            projects = self._get_projects(refresh=found_merge_requests)
+            found_merge_requests = self._process_projects(
                 repo_manager,
                 time_to_sleep_between_projects_in_secs,
                 projects,
@@ -62,27 +110,68 @@ class Bot:
             if self._config.cli:
                 return
 
-            big_sleep = max(0,
-                            min_time_to_sleep_after_iterating_all_projects_in_secs -
-                            time_to_sleep_between_projects_in_secs * len(projects))
+            self._adapt_polling_interval(found_merge_requests)
+            big_sleep = self._polling_interval_in_secs
             log.info('Sleeping for %s seconds...', big_sleep)
-            time.sleep(big_sleep)
+            self._stop.wait(big_sleep)
+        log.info('Stopped.')
+
+    def stop(self):
+        """Ask the bot to stop, giving up on the merge request at hand as soon as it's only waiting."""
+        self._stop.set()
+
+    def _during_merge_embargo(self):
+        return self._config.merge_opts.embargo.covers(datetime.utcnow())
+
+    def _time_until_embargo_ends(self):
+        time_until_uncovered = self._config.merge_opts.embargo.time_until_uncovered(datetime.utcnow())
+        # an embargo that never ends still shouldn't make us sleep forever
+        return self.MAX_EMBARGO_SLEEP if time_until_uncovered is None else time_until_uncovered
+
+    def _adapt_polling_interval(self, found_merge_requests):
+        # Poll more often while there is work queued up, and back off
+        # geometrically while every project comes back empty.
+        if found_merge_requests:
+            self._polling_interval_in_secs = max(
+                self.MIN_POLLING_INTERVAL_IN_SECS,
+                round(self._polling_interval_in_secs * self.POLLING_SPEEDUP_FACTOR, 1),
+            )
+        else:
+            self._polling_interval_in_secs = min(
+                self.MAX_POLLING_INTERVAL_IN_SECS,
+                round(self._polling_interval_in_secs * self.POLLING_BACKOFF_FACTOR, 1),
+            )
+
+    def _get_projects(self, refresh=False):
+        now = time.monotonic()
+        if (
+                refresh or self._projects is None or
+                now - self._projects_fetched_at >= self.PROJECTS_CACHE_TTL_IN_SECS
+        ):
+            self._projects = self._fetch_projects()
+            self._projects_fetched_at = now
+        else:
+            log.info('Reusing my projects from %d seconds ago...', now - self._projects_fetched_at)
+        return self._projects
 
-    def _get_projects(self):
+    def _fetch_projects(self):
         log.info('Finding out my current projects...')
-        my_projects = Project.fetch_all_mine(self._api)
-        project_regexp = self._config.project_regexp
-        filtered_projects = [p for p in my_projects if project_regexp.match(p.path_with_namespace)]
-        log.debug(
-            'Projects that match project_regexp: %s',
-            [p.path_with_namespace for p in filtered_projects]
+        my_projects = Project.fetch_all_mine(
+            self._api, search=_regexp_literal_prefix(self._config.project_regexp),
         )
-        filtered_out = set(my_projects) - set(filtered_projects)
-        if filtered_out:
+        project_match = self._project_match
+        filtered_projects = [p for p in my_projects if project_match(p.path_with_namespace)]
+        if log.getLogger().isEnabledFor(log.DEBUG):
             log.debug(
-                'Projects that do not match project_regexp: %s',
-                [p.path_with_namespace for p in filtered_out]
+                'Projects that match project_regexp: %s',
+                [p.path_with_namespace for p in filtered_projects]
             )
+            if len(filtered_projects) < len(my_projects):
+                filtered_in = set(filtered_projects)
+                log.debug(
+                    'Projects that do not match project_regexp: %s',
+                    [p.path_with_namespace for p in my_projects if p not in filtered_in]
+                )
         return filtered_projects
 
     def _process_projects(
@@ -91,50 +180,72 @@ class Bot:
         time_to_sleep_between_projects_in_secs,
         projects,
     ):
+        browsable_projects = []
         for project in projects:
+            if project.access_level.value < _MIN_ACCESS_LEVEL:
+                log.warning(
+                    "Don't have enough permissions to browse merge requests in %s!",
+                    project.path_with_namespace,
+                )
+            else:
+                browsable_projects.append(project)
+        merge_requests_by_project = self._get_merge_requests_by_project(
+            {project.id for project in browsable_projects},
+        )
+        found_merge_requests = False
+        for project in browsable_projects:
+            if self._stop.is_set():
+                break
             project_name = project.path_with_namespace
-
-            if project.access_level < AccessLevel.reporter:
-                log.warning("Don't have enough permissions to browse merge requests in %s!", project_name)
-                continue
-            merge_requests = self._get_merge_requests(project, project_name)
+            merge_requests = self._filter_merge_requests(
+                project_name, merge_requests_by_project.get(project.id, []),
+            )
             self._process_merge_requests(repo_manager, project, merge_requests)
-            time.sleep(time_to_sleep_between_projects_in_secs)
+            if merge_requests:
+                found_merge_requests = True
+                self._stop.wait(time_to_sleep_between_projects_in_secs)
+        return found_merge_requests
 
-    def _get_merge_requests(self, project, project_name):
-        log.info('Fetching merge requests assigned to me in %s...', project_name)
-        my_merge_requests = MergeRequest.fetch_all_open_for_user(
-            project_id=project.id,
+    def _get_merge_requests_by_project(self, project_ids):
+        log.info('Fetching merge requests assigned to me...')
+        return MergeRequest.fetch_all_open_assigned_to_me(
             user=self.user,
             api=self._api,
             merge_order=self._config.merge_order,
+            project_ids=project_ids,
         )
-        branch_regexp = self._config.branch_regexp
+
+    def _filter_merge_requests(self, project_name, my_merge_requests):
+        log.info('Got %s merge requests assigned to me in %s', len(my_merge_requests), project_name)
+        branch_match = self._config.branch_regexp.match
         filtered_mrs = [mr for mr in my_merge_requests
-                        if branch_regexp.match(mr.target_branch)]
-        log.debug(
-            'MRs that match branch_regexp: %s',
-            [mr.web_url for mr in filtered_mrs]
-        )
-        filtered_out = set(my_merge_requests) - set(filtered_mrs)
-        if filtered_out:
+                        if branch_match(mr.target_branch)]
+        source_branch_match = self._config.source_branch_regexp.match
+        source_filtered_mrs = [mr for mr in filtered_mrs
+                               if source_branch_match(mr.source_branch)]
+        if log.getLogger().isEnabledFor(log.DEBUG):
             log.debug(
-                'MRs that do not match branch_regexp: %s',
-                [mr.web_url for mr in filtered_out]
+                'MRs that match branch_regexp: %s',
+                [mr.web_url for mr in filtered_mrs]
             )
-        source_branch_regexp = self._config.source_branch_regexp
-        source_filtered_mrs = [mr for mr in filtered_mrs
-                               if source_branch_regexp.match(mr.source_branch)]
-        log.debug(
-            'MRs that match source_branch_regexp: %s',
-            [mr.web_url for mr in source_filtered_mrs]
-        )
-        source_filtered_out = set(filtered_mrs) - set(source_filtered_mrs)
-        if filtered_out:
+            filtered_iids = {mr.iid for mr in filtered_mrs}
+            filtered_out = [mr for mr in my_merge_requests if mr.iid not in filtered_iids]
+            if filtered_out:
+                log.debug(
+                    'MRs that do not match branch_regexp: %s',
+                    [mr.web_url for mr in filtered_out]
+                )
             log.debug(
-                'MRs that do not match source_branch_regexp: %s',
-                [mr.web_url for mr in source_filtered_out]
+                'MRs that match source_branch_regexp: %s',
+                [mr.web_url for mr in source_filtered_mrs]
             )
+            source_filtered_iids = {mr.iid for mr in source_filtered_mrs}
+            source_filtered_out = [mr for mr in filtered_mrs if mr.iid not in source_filtered_iids]
+            if source_filtered_out:
+                log.debug(
+                    'MRs that do not match source_branch_regexp: %s',
+                    [mr.web_url for mr in source_filtered_out]
+                )
         return source_filtered_mrs
 
     def _process_merge_requests(self, repo_manager, project, merge_requests):
@@ -158,6 +269,7 @@ class Bot:
                 merge_requests=merge_requests,
                 repo=repo,
                 options=self._config.merge_opts,
+                stop=self._stop,
             )
             try:
                 batch_merge_job.execute()
@@ -169,13 +281,18 @@ class Bot:
                 return
             except git.GitError as err:
                 log.exception('BatchMergeJob failed: %s', err)
-        log.info('Attempting to merge the oldest MR...')
-        merge_request = merge_requests[0]
-        merge_job = self._get_single_job(
-            project=project, merge_request=merge_request, repo=repo,
-            options=self._config.merge_opts,
-        )
-        merge_job.execute()
+        for merge_request in merge_requests:
+            if self._stop.is_set():
+                return
+            if self._during_merge_embargo():
+                log.info('Merge embargo! Leaving the remaining MRs for later...')
+                return
+            log.info('Attempting to merge the oldest remaining MR...')
+            merge_job = self._get_single_job(
+                project=project, merge_request=merge_request, repo=repo,
+                options=self._config.merge_opts,
+            )
+            merge_job.execute()
 
     def _get_single_job(self, project, merge_request, repo, options):
         return single_merge_job.SingleMergeJob(
@@ -185,12 +302,31 @@ class Bot:
             merge_request=merge_request,
             repo=repo,
             options=options,
+            stop=self._stop,
         )
 
 
+def _regexp_literal_prefix(regexp, min_length=3):
+    """The literal text every string matched by `regexp` must start with, if it's long enough to use."""
+    pattern = regexp.pattern
+    if '|' in pattern:
+        return None
+    prefix = []
+    for char in pattern.lstrip('^'):
+        if char in '*?{':
+            # the quantifier makes the previous character optional
+            prefix = prefix[:-1]
+            break
+        if char in '.^$+[]()\\':
+            break
+        prefix.append(char)
+    prefix = ''.join(prefix)
+    return prefix if len(prefix) >= min_length else None
+
+
 class BotConfig(namedtuple('BotConfig',
                            'user ssh_key_file project_regexp merge_order merge_opts git_timeout ' +
-                           'git_reference_repo branch_regexp source_branch_regexp batch cli')):
+                           'git_reference_repo repo_cache_dir branch_regexp source_branch_regexp batch cli')):
     pass
 
 
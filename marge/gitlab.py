@@ -1,30 +1,57 @@
 import json
 import logging as log
-from collections import namedtuple
+import time
+from collections import OrderedDict, namedtuple
 
 import requests
+from requests.adapters import HTTPAdapter
 
 
 class Api:
+    MAX_RATE_LIMIT_RETRIES = 3
+    DEFAULT_RETRY_AFTER_IN_SECS = 10
+    MAX_CACHED_RESPONSES = 256
+    CONNECTION_POOL_SIZE = 16
+
     def __init__(self, gitlab_url, auth_token):
         self._auth_token = auth_token
         self._api_base_url = gitlab_url.rstrip('/') + '/api/v4'
+        # keep connections alive across calls, rather than doing a TCP+TLS handshake for each one
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.CONNECTION_POOL_SIZE,
+            pool_maxsize=self.CONNECTION_POOL_SIZE,
+        )
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        # GET responses by request, kept as (etag, raw body) so we can ask
+        # GitLab with If-None-Match whether they are still current
+        self._cached_responses = OrderedDict()
 
     def call(self, command, sudo=None):
-        method = command.method
+        method = getattr(self._session, command.method)
         url = self._api_base_url + command.endpoint
         headers = {'PRIVATE-TOKEN': self._auth_token}
         if sudo:
             headers['SUDO'] = '%d' % sudo
-        log.debug('REQUEST: %s %s %r %r', method.__name__.upper(), url, headers, command.call_args)
+        cache_key = self._make_conditional(command, url, sudo, headers)
+        log.debug('REQUEST: %s %s %r %r', command.method.upper(), url, headers, command.call_args)
         # Timeout to prevent indefinitely hanging requests. 60s is very conservative,
         # but should be short enough to not cause any practical annoyances. We just
         # crash rather than retry since marge-bot should be run in a restart loop anyway.
-        try:
-            response = method(url, headers=headers, timeout=60, **command.call_args)
-        except requests.exceptions.Timeout as err:
-            log.error('Request timeout: %s', err)
-            raise
+        retries_left = self.MAX_RATE_LIMIT_RETRIES
+        while True:
+            try:
+                response = method(url, headers=headers, timeout=60, **command.call_args)
+            except requests.exceptions.Timeout as err:
+                log.error('Request timeout: %s', err)
+                raise
+            if response.status_code != 429 or not retries_left:
+                break
+            retries_left -= 1
+            retry_after = self._retry_after_in_secs(response)
+            log.warning('Rate limited by GitLab, retrying in %s seconds...', retry_after)
+            time.sleep(retry_after)
         log.debug('RESPONSE CODE: %s', response.status_code)
         log.debug('RESPONSE BODY: %r', response.content)
 
@@ -35,10 +62,11 @@ class Api:
             return True  # NoContent
 
         if response.status_code < 300:
+            self._remember_response(cache_key, response)
             return command.extract(response.json()) if command.extract else response.json()
 
         if response.status_code == 304:
-            return False  # Not Modified
+            return self._not_modified_result(command, cache_key)
 
         errors = {
             400: BadRequest,
@@ -49,6 +77,7 @@ class Api:
             406: NotAcceptable,
             409: Conflict,
             422: Unprocessable,
+            429: TooManyRequests,
             500: InternalServerError,
         }
 
@@ -64,6 +93,47 @@ class Api:
 
         raise error(response.status_code, err_message)
 
+    def _make_conditional(self, command, url, sudo, headers):
+        """Ask for a GET we have a cached response for only if it changed; returns its cache key."""
+        if not isinstance(command, GET):
+            return None
+        cache_key = (url, sudo, tuple(sorted(command.call_args['params'].items())))
+        cached_response = self._cached_response(cache_key)
+        if cached_response:
+            headers['If-None-Match'] = cached_response[0]
+        return cache_key
+
+    def _not_modified_result(self, command, cache_key):
+        cached_response = self._cached_response(cache_key) if cache_key else None
+        if not cached_response:
+            return False  # Not Modified
+        log.debug('Using cached response body')
+        result = json.loads(cached_response[1])
+        return command.extract(result) if command.extract else result
+
+    def _remember_response(self, cache_key, response):
+        if cache_key and response.headers.get('ETag'):
+            self._cache_response(cache_key, response.headers['ETag'], response.content)
+
+    def _cached_response(self, cache_key):
+        cached_response = self._cached_responses.get(cache_key)
+        if cached_response:
+            self._cached_responses.move_to_end(cache_key)
+        return cached_response
+
+    def _cache_response(self, cache_key, etag, content):
+        self._cached_responses[cache_key] = (etag, content)
+        self._cached_responses.move_to_end(cache_key)
+        while len(self._cached_responses) > self.MAX_CACHED_RESPONSES:
+            self._cached_responses.popitem(last=False)
+
+    def _retry_after_in_secs(self, response):
+        try:
+            return max(0, int(response.headers['Retry-After']))
+        except (KeyError, ValueError):
+            # Retry-After may also be an HTTP date; don't bother parsing it
+            return self.DEFAULT_RETRY_AFTER_IN_SECS
+
     def collect_all_pages(self, get_command):
         result = []
         fetch_again, page_no = True, 1
@@ -107,7 +177,7 @@ class Command(namedtuple('Command', 'endpoint args extract')):
 class GET(Command):
     @property
     def method(self):
-        return requests.get
+        return 'get'
 
     @property
     def call_args(self):
@@ -121,19 +191,19 @@ class GET(Command):
 class PUT(Command):
     @property
     def method(self):
-        return requests.put
+        return 'put'
 
 
 class POST(Command):
     @property
     def method(self):
-        return requests.post
+        return 'post'
 
 
 class DELETE(Command):
     @property
     def method(self):
-        return requests.delete
+        return 'delete'
 
 
 def _prepare_params(params):
@@ -190,6 +260,10 @@ class Unprocessable(ApiError):
     pass
 
 
+class TooManyRequests(ApiError):
+    pass
+
+
 class InternalServerError(ApiError):
     pass
 
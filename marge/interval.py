@@ -1,4 +1,5 @@
 import operator
+from datetime import datetime, timedelta
 from enum import Enum, unique
 
 import maya
@@ -98,6 +99,20 @@ class WeeklyInterval:
     def covers(self, date):
         return self._interval_covers(date) != self._is_complement_interval
 
+    def next_ends(self, date):
+        """The first two moments after `date` that fall just past the end of the interval."""
+        if self._is_complement_interval:
+            end_weekday, end_time = self._from_weekday, self._from_time
+        else:
+            end_weekday, end_time = self._to_weekday, self._to_time
+        days_ahead = (end_weekday.value - date.date().weekday()) % 7
+        end = datetime.combine(
+            date.date() + timedelta(days=days_ahead), end_time, tzinfo=date.tzinfo,
+        ) + timedelta(microseconds=1)
+        if end <= date:
+            end += timedelta(weeks=1)
+        return [end, end + timedelta(weeks=1)]
+
     def _interval_covers(self, date):
         weekday = date.date().weekday()
         time = date.time()
@@ -141,3 +156,13 @@ class IntervalUnion:
 
     def covers(self, date):
         return any(interval.covers(date) for interval in self._intervals)
+
+    def time_until_uncovered(self, date):
+        """How long until a moment not covered by any interval; None if there is no such moment."""
+        if not self.covers(date):
+            return timedelta(0)
+        ends = sorted(end for interval in self._intervals for end in interval.next_ends(date))
+        for end in ends:
+            if not self.covers(end):
+                return end - date
+        return None
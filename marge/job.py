@@ -16,12 +16,13 @@ from .pipeline import Pipeline
 
 class MergeJob:
 
-    def __init__(self, *, api, user, project, repo, options):
+    def __init__(self, *, api, user, project, repo, options, stop=None):
         self._api = api
         self._user = user
         self._project = project
         self._repo = repo
         self._options = options
+        self._stop = stop
         self._merge_timeout = timedelta(minutes=5)
 
     @property
@@ -35,6 +36,13 @@ class MergeJob:
     def execute(self):
         raise NotImplementedError
 
+    def sleep(self, secs):
+        """Wait `secs`, but give up on the merge request for now as soon as we're asked to stop."""
+        if self._stop is None:
+            time.sleep(secs)
+        elif self._stop.wait(secs):
+            raise SkipMerge("I'm shutting down, I'll get back to it once I'm restarted.")
+
     def ensure_mergeable_mr(self, merge_request):
         merge_request.refetch_info()
         log.info('Ensuring MR !%s is mergeable', merge_request.iid)
@@ -186,7 +194,7 @@ class MergeJob:
                 log.warning('Suspicious CI status: %r', ci_status)
 
             log.debug('Waiting for %s secs before polling CI status again', waiting_time_in_secs)
-            time.sleep(waiting_time_in_secs)
+            self.sleep(waiting_time_in_secs)
 
         raise CannotMerge('CI is taking too long.')
 
@@ -219,7 +227,7 @@ class MergeJob:
             if merge_status == 'unchecked':
                 log.info('MR !%s merge status currently unchecked on attempt %d.', merge_request.iid, attempt)
 
-            time.sleep(waiting_time_in_secs)
+            self.sleep(waiting_time_in_secs)
 
     def unassign_from_mr(self, merge_request):
         log.info('Unassigning from MR !%s', merge_request.iid)
@@ -247,7 +255,7 @@ class MergeJob:
             log.info('Checking if approvals have reset')
             while sufficient_approvals() and iterations:
                 log.debug('Approvals haven\'t reset yet, sleeping for %s secs', waiting_time_in_secs)
-                time.sleep(waiting_time_in_secs)
+                self.sleep(waiting_time_in_secs)
                 iterations -= 1
             if not sufficient_approvals():
                 approvals.reapprove()
@@ -2,6 +2,7 @@ import sys
 import logging as log
 import time
 import datetime
+from collections import defaultdict
 
 from . import gitlab
 from .approvals import Approvals
@@ -66,8 +67,34 @@ class MergeRequest(gitlab.Resource):
             '/projects/{project_id}/merge_requests'.format(project_id=project_id),
             {'state': 'opened', 'order_by': request_merge_order, 'sort': 'asc'},
         ))
+        return cls._mine_in_merge_order(all_merge_request_infos, user, api, merge_order)
+
+    @classmethod
+    def fetch_all_open_assigned_to_me(cls, user, api, merge_order, project_ids):
+        """Like `fetch_all_open_for_user`, but for all of `project_ids` in a single (paginated) request.
+
+        `user` must be the user `api` is authenticated as. Returns the merge requests by project id;
+        those in other projects are dropped before doing any per-MR work (e.g. to find `assigned_at`).
+        """
+        request_merge_order = 'created_at' if merge_order == 'assigned_at' else merge_order
+
+        all_merge_request_infos = api.collect_all_pages(GET(
+            '/merge_requests',
+            {'scope': 'assigned_to_me', 'state': 'opened', 'order_by': request_merge_order, 'sort': 'asc'},
+        ))
+        merge_request_infos_by_project = defaultdict(list)
+        for merge_request_info in all_merge_request_infos:
+            if merge_request_info['project_id'] in project_ids:
+                merge_request_infos_by_project[merge_request_info['project_id']].append(merge_request_info)
+        return {
+            project_id: cls._mine_in_merge_order(merge_request_infos, user, api, merge_order)
+            for project_id, merge_request_infos in merge_request_infos_by_project.items()
+        }
+
+    @classmethod
+    def _mine_in_merge_order(cls, merge_request_infos, user, api, merge_order):
         my_merge_request_infos = [
-            mri for mri in all_merge_request_infos
+            mri for mri in merge_request_infos
             if ((mri.get('assignee', {}) or {}).get('id') == user.id) or
                (user.id in [assignee.get('id') for assignee in (mri.get('assignees', []) or [])])
         ]
@@ -26,7 +26,7 @@ class Project(gitlab.Resource):
         return gitlab.from_singleton_list(make_project)(filter_by_path_with_namespace(all_projects))
 
     @classmethod
-    def fetch_all_mine(cls, api):
+    def fetch_all_mine(cls, api, search=None):
         projects_kwargs = {'membership': True,
                            'with_merge_requests_enabled': True,
                            'archived': False,
@@ -35,7 +35,14 @@ class Project(gitlab.Resource):
         # GitLab has an issue where projects may not show appropriate permissions in nested groups. Using
         # `min_access_level` is known to provide the correct projects, so we'll prefer this method
         # if it's available. See #156 for more details.
-        use_min_access_level = api.version().release >= (11, 2)
+        version = api.version()
+        use_min_access_level = version.release >= (11, 2)
+        if search and version.release >= (12, 0):
+            # Without `search_namespaces`, GitLab would only search project names and paths,
+            # not the full path (with namespace) that callers filter on. This is just a hint to
+            # keep pagination short: results are a superset of projects whose path contains `search`.
+            projects_kwargs['search'] = search
+            projects_kwargs['search_namespaces'] = True
         if use_min_access_level:
             projects_kwargs["min_access_level"] = int(AccessLevel.developer)
 
@@ -1,6 +1,5 @@
 # pylint: disable=too-many-locals,too-many-branches,too-many-statements
 import logging as log
-import time
 from datetime import datetime
 
 from . import git, gitlab
@@ -10,8 +9,8 @@ from .job import CannotMerge, GitLabRebaseResultMismatch, MergeJob, SkipMerge
 
 class SingleMergeJob(MergeJob):
 
-    def __init__(self, *, api, user, project, repo, options, merge_request):
-        super().__init__(api=api, user=user, project=project, repo=repo, options=options)
+    def __init__(self, *, api, user, project, repo, options, merge_request, stop=None):
+        super().__init__(api=api, user=user, project=project, repo=repo, options=options, stop=stop)
         self._merge_request = merge_request
 
     def execute(self):
@@ -62,7 +61,7 @@ class SingleMergeJob(MergeJob):
                 continue
 
             log.info('Commit id to merge %r (into: %r)', actual_sha, target_sha)
-            time.sleep(5)
+            self.sleep(5)
 
             sha_now = Commit.last_on_branch(source_project.id, merge_request.source_branch, api).id
             # Make sure no-one managed to race and push to the branch in the
@@ -75,7 +74,7 @@ class SingleMergeJob(MergeJob):
 
             if target_project.only_allow_merge_if_pipeline_succeeds:
                 self.wait_for_ci_to_pass(merge_request, actual_sha)
-                time.sleep(2)
+                self.sleep(2)
 
             self.wait_for_merge_status_to_resolve(merge_request)
 
@@ -166,6 +165,6 @@ class SingleMergeJob(MergeJob):
             assert merge_request.state in ('opened', 'reopened', 'locked'), merge_request.state
 
             log.info('Giving %s more secs for !%s to be merged...', waiting_time_in_secs, merge_request.iid)
-            time.sleep(waiting_time_in_secs)
+            self.sleep(waiting_time_in_secs)
 
         raise CannotMerge('It is taking too long to see the request marked as merged!')
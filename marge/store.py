@@ -1,3 +1,6 @@
+import logging as log
+import os
+import shutil
 import tempfile
 
 from . import git
@@ -5,23 +8,42 @@ from . import git
 
 class RepoManager:
 
-    def __init__(self, user, root_dir, ssh_key_file=None, timeout=None, reference=None):
+    def __init__(self, user, root_dir, ssh_key_file=None, timeout=None, reference=None, persistent=False):
         self._root_dir = root_dir
         self._user = user
         self._ssh_key_file = ssh_key_file
         self._repos = {}
         self._timeout = timeout
         self._reference = reference
+        # a persistent root_dir outlives us, so keep one clone per project in it that
+        # can be picked up again (and merely fetched) the next time we start
+        self._persistent = persistent
 
     def repo_for_project(self, project):
         repo = self._repos.get(project.id)
         if not repo or repo.remote_url != project.ssh_url_to_repo:
             repo_url = project.ssh_url_to_repo
-            local_repo_dir = tempfile.mkdtemp(dir=self._root_dir)
+            if self._persistent:
+                local_repo_dir = self._persistent_repo_dir(project)
+            else:
+                local_repo_dir = tempfile.mkdtemp(dir=self._root_dir)
 
             repo = git.Repo(repo_url, local_repo_dir, ssh_key_file=self._ssh_key_file,
                             timeout=self._timeout, reference=self._reference)
-            repo.clone()
+            if self._persistent and os.path.isdir(os.path.join(local_repo_dir, '.git')):
+                log.info('Reusing existing clone of %s', repo_url)
+                try:
+                    _clean_clone(repo)
+                    repo.git('remote', 'set-url', 'origin', repo_url)
+                    repo.fetch('origin')
+                except git.GitError:
+                    log.warning('Existing clone of %s is unusable, cloning it again', repo_url)
+                    shutil.rmtree(local_repo_dir)
+                    repo.clone()
+            else:
+                if self._persistent and os.path.exists(local_repo_dir):
+                    shutil.rmtree(local_repo_dir)
+                repo.clone()
             repo.config_user_info(
                 user_email=self._user.email,
                 user_name=self._user.name,
@@ -34,6 +56,9 @@ class RepoManager:
     def forget_repo(self, project):
         self._repos.pop(project.id, None)
 
+    def _persistent_repo_dir(self, project):
+        return os.path.join(self._root_dir, str(project.id))
+
     @property
     def user(self):
         return self._user
@@ -45,3 +70,18 @@ class RepoManager:
     @property
     def ssh_key_file(self):
         return self._ssh_key_file
+
+
+def _clean_clone(repo):
+    """Undo whatever a previous run may have left half-done in a reused clone."""
+    git_dir = os.path.join(repo.local_path, '.git')
+    for dir_path, _dir_names, file_names in os.walk(git_dir):
+        for file_name in file_names:
+            if file_name.endswith('.lock'):
+                os.remove(os.path.join(dir_path, file_name))
+    if any(os.path.exists(os.path.join(git_dir, name)) for name in ('rebase-merge', 'rebase-apply')):
+        repo.git('rebase', '--abort')
+    if os.path.exists(os.path.join(git_dir, 'MERGE_HEAD')):
+        repo.git('merge', '--abort')
+    repo.git('reset', '--hard')
+    repo.git('clean', '-fdx')
@@ -1,3 +1,4 @@
+import functools
 import re
 import logging as log
 from collections import namedtuple
@@ -246,4 +247,10 @@ class MockedEndpointNotFound(Exception):
 
 
 def attrs(_dict):
-    return namedtuple('Attrs', _dict.keys())(*_dict.values())
+    return _attrs_type(tuple(_dict.keys()))(*_dict.values())
+
+
+@functools.lru_cache(maxsize=None)
+def _attrs_type(keys):
+    # building a namedtuple type is costly, and the mock gets (re)built for every single test
+    return namedtuple('Attrs', keys)
@@ -3,6 +3,7 @@ import datetime
 import os
 import re
 import shlex
+import signal
 import tempfile
 import unittest.mock as mock
 
@@ -78,10 +79,12 @@ def main(cmdline=''):
         def config(self):
             return self._config
 
-    with mock.patch('marge.bot.Bot', new=DoNothingBot), mock.patch('marge.gitlab.Api', new=api_mock):
+    with mock.patch('marge.bot.Bot', new=DoNothingBot), mock.patch('marge.gitlab.Api', new=api_mock), \
+            mock.patch('signal.signal') as signal_mock:
         app.main(args=shlex.split(cmdline))
         the_bot = DoNothingBot.instance
         assert the_bot is not None
+        the_bot.signal_mock = signal_mock
         yield the_bot
 
 
@@ -95,6 +98,18 @@ def test_default_values():
             assert bot.config.merge_order == 'created_at'
 
 
+def test_sigterm_stops_bot():
+    with env(MARGE_AUTH_TOKEN="NON-ADMIN-TOKEN", MARGE_SSH_KEY="KEY", MARGE_GITLAB_URL='http://foo.com'):
+        with main() as bot:
+            (signum, handler), _ = bot.signal_mock.call_args
+            assert signum == signal.SIGTERM
+            with mock.patch.object(bot, 'stop') as stop:
+                handler(signum, None)
+            stop.assert_called_once_with()
+            # a second SIGTERM should kill us straight away
+            bot.signal_mock.assert_called_with(signal.SIGTERM, signal.SIG_DFL)
+
+
 def test_embargo():
     with env(MARGE_AUTH_TOKEN="NON-ADMIN-TOKEN", MARGE_SSH_KEY="KEY", MARGE_GITLAB_URL='http://foo.com'):
         with main('--embargo="Fri 1pm-Mon 7am"') as bot:
@@ -300,3 +315,50 @@ def test_config_overwrites():
                 assert bot.config.project_regexp == re.compile('foo.*bar')
                 assert bot.config.git_timeout == datetime.timedelta(seconds=100)
                 assert bot.config.branch_regexp == re.compile('foo.*bar')
+
+
+def test_same_regexp_is_compiled_once():
+    with env(MARGE_AUTH_TOKEN="NON-ADMIN-TOKEN", MARGE_SSH_KEY="KEY", MARGE_GITLAB_URL='http://foo.com'):
+        with main("--project-regexp='foo.*bar' --branch-regexp='foo.*bar'") as bot:
+            assert bot.config.project_regexp is bot.config.branch_regexp
+
+
+def test_empty_auth_token():
+    with env(MARGE_AUTH_TOKEN="", MARGE_SSH_KEY="KEY", MARGE_GITLAB_URL='http://foo.com'):
+        with pytest.raises(app.MargeBotCliArgError):
+            with main():
+                pass
+
+
+def test_auth_token_file():
+    with tempfile.NamedTemporaryFile(mode='w', prefix='token-') as token_file:
+        token_file.write('ADMIN-TOKEN\n')
+        token_file.flush()
+        with env(
+                MARGE_AUTH_TOKEN_FILE=token_file.name, MARGE_SSH_KEY="KEY", MARGE_GITLAB_URL='http://foo.com',
+        ):
+            with main() as bot:
+                assert bot.user.is_admin
+
+
+def test_auth_token_is_stripped():
+    with env(MARGE_AUTH_TOKEN=" ADMIN-TOKEN\n", MARGE_SSH_KEY="KEY", MARGE_GITLAB_URL='http://foo.com'):
+        with main() as bot:
+            assert bot.user.is_admin
+
+
+def test_empty_auth_token_file():
+    with tempfile.NamedTemporaryFile(mode='w', prefix='token-') as token_file:
+        with env(
+                MARGE_AUTH_TOKEN_FILE=token_file.name, MARGE_SSH_KEY="KEY", MARGE_GITLAB_URL='http://foo.com',
+        ):
+            with pytest.raises(app.MargeBotCliArgError):
+                with main():
+                    pass
+
+
+def test_empty_ssh_key():
+    with env(MARGE_AUTH_TOKEN="NON-ADMIN-TOKEN", MARGE_SSH_KEY="", MARGE_GITLAB_URL='http://foo.com'):
+        with pytest.raises(app.MargeBotCliArgError):
+            with main():
+                pass
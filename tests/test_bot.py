@@ -0,0 +1,207 @@
+import logging
+import re
+import time
+from datetime import datetime, timedelta
+from unittest.mock import ANY, Mock, patch
+
+import pytest
+
+import marge.bot as bot_module
+import marge.gitlab as gitlab
+import marge.interval as interval
+
+
+def make_bot(**config_overrides):
+    config = Mock(bot_module.BotConfig)
+    config.user = Mock(is_admin=True)
+    config.merge_opts = bot_module.MergeJobOptions.default()
+    for key, value in config_overrides.items():
+        setattr(config, key, value)
+    return bot_module.Bot(api=Mock(gitlab.Api), config=config)
+
+
+# pylint: disable=protected-access
+def test_bot_has_no_instance_dict():
+    assert not hasattr(make_bot(), '__dict__')
+
+
+class TestPollingInterval:
+    def test_backs_off_while_idle(self):
+        bot = make_bot()
+        intervals = []
+        for _ in range(10):
+            bot._adapt_polling_interval(found_merge_requests=False)
+            intervals.append(bot._polling_interval_in_secs)
+        assert intervals == sorted(intervals)
+        assert intervals[0] > 30
+        assert intervals[-1] == bot_module.Bot.MAX_POLLING_INTERVAL_IN_SECS
+
+    def test_speeds_up_while_busy(self):
+        bot = make_bot()
+        intervals = []
+        for _ in range(10):
+            bot._adapt_polling_interval(found_merge_requests=True)
+            intervals.append(bot._polling_interval_in_secs)
+        assert intervals == sorted(intervals, reverse=True)
+        assert intervals[0] < 30
+        assert intervals[1] == 10.8  # rather than 10.799999999999999, so it logs nicely
+        assert intervals[-1] == bot_module.Bot.MIN_POLLING_INTERVAL_IN_SECS
+
+
+class TestProjectsCache:
+    def test_reuses_projects_within_ttl(self):
+        bot = make_bot()
+        with patch.object(bot_module.Bot, '_fetch_projects', side_effect=[['a'], ['b']]) as fetch_projects, \
+                patch('time.monotonic', side_effect=[1000, 1010]):
+            assert bot._get_projects() == ['a']
+            assert bot._get_projects() == ['a']
+        assert fetch_projects.call_count == 1
+
+    def test_refetches_projects_after_ttl(self):
+        bot = make_bot()
+        ttl = bot_module.Bot.PROJECTS_CACHE_TTL_IN_SECS
+        with patch.object(bot_module.Bot, '_fetch_projects', side_effect=[['a'], ['b']]), \
+                patch('time.monotonic', side_effect=[1000, 1000 + ttl]):
+            assert bot._get_projects() == ['a']
+            assert bot._get_projects() == ['b']
+
+    def test_refetches_projects_when_asked(self):
+        bot = make_bot()
+        with patch.object(bot_module.Bot, '_fetch_projects', side_effect=[['a'], ['b']]), \
+                patch('time.monotonic', side_effect=[1000, 1010]):
+            assert bot._get_projects() == ['a']
+            assert bot._get_projects(refresh=True) == ['b']
+
+
+class TestEmbargo:
+    def test_no_embargo(self):
+        bot = make_bot()
+        assert bot._time_until_embargo_ends() == timedelta(0)
+
+    def test_sleeps_until_embargo_ends(self):
+        embargo = interval.IntervalUnion.from_human('Mon 9am - Mon 10am')
+        bot = make_bot(merge_opts=bot_module.MergeJobOptions.default(embargo=embargo))
+        with patch('marge.bot.datetime', Mock(utcnow=Mock(return_value=datetime(2020, 1, 6, 9, 30)))):
+            assert bot._time_until_embargo_ends() == timedelta(minutes=30, microseconds=1)
+
+    def test_never_ending_embargo(self):
+        embargo = interval.IntervalUnion.from_human('Mon 0:00 - Sun 23:59, Sun 23:00 - Mon 1:00')
+        bot = make_bot(merge_opts=bot_module.MergeJobOptions.default(embargo=embargo))
+        assert bot._time_until_embargo_ends() == bot_module.Bot.MAX_EMBARGO_SLEEP
+
+
+def test_regexp_literal_prefix():
+    def prefix(pattern):
+        return bot_module._regexp_literal_prefix(re.compile(pattern))
+
+    assert prefix('some_group/.*') == 'some_group/'
+    assert prefix('^some_group/.*') == 'some_group/'
+    assert prefix('some_group/projects?') == 'some_group/project'
+    assert prefix('some_group+') == 'some_group'
+    assert prefix('.*') is None
+    assert prefix('ab.*') is None
+    assert prefix('some_group/(foo|bar)') is None
+    assert prefix('(?!exclude/me)') is None
+
+
+def test_filter_merge_requests_by_branches(caplog):
+    bot = make_bot(branch_regexp=re.compile('master'), source_branch_regexp=re.compile('feature/'))
+    wanted = Mock(iid=1, target_branch='master', source_branch='feature/a', web_url='wanted')
+    wrong_target = Mock(iid=2, target_branch='stable', source_branch='feature/b', web_url='wrong_target')
+    wrong_source = Mock(iid=3, target_branch='master', source_branch='hotfix/c', web_url='wrong_source')
+    with caplog.at_level(logging.DEBUG):
+        merge_requests = bot._filter_merge_requests('cool/project', [wanted, wrong_target, wrong_source])
+    assert merge_requests == [wanted]
+    assert "MRs that do not match branch_regexp: ['wrong_target']" in caplog.text
+    assert "MRs that do not match source_branch_regexp: ['wrong_source']" in caplog.text
+
+
+def test_get_merge_requests_by_project():
+    bot = make_bot(merge_order='created_at')
+    merge_requests_by_project = {1: [Mock(project_id=1)]}
+    with patch.object(bot_module.MergeRequest, 'fetch_all_open_assigned_to_me',
+                      return_value=merge_requests_by_project) as fetch_all_open_assigned_to_me:
+        assert bot._get_merge_requests_by_project({1, 2}) == merge_requests_by_project
+    fetch_all_open_assigned_to_me.assert_called_once_with(
+        user=bot.user, api=bot.api, merge_order='created_at', project_ids={1, 2},
+    )
+
+
+def test_process_projects_only_fetches_merge_requests_for_browsable_projects():
+    bot = make_bot(batch=False)
+    browsable = Mock(id=1, access_level=bot_module.AccessLevel.developer)
+    not_browsable = Mock(id=2, access_level=bot_module.AccessLevel.guest)
+    with patch.object(bot_module.Bot, '_get_merge_requests_by_project', return_value={}) as get_mrs, \
+            patch.object(bot_module.Bot, '_process_merge_requests') as process_merge_requests:
+        assert not bot._process_projects(Mock(), 0, [browsable, not_browsable])
+    get_mrs.assert_called_once_with({1})
+    process_merge_requests.assert_called_once_with(ANY, browsable, [])
+
+
+class TestProcessMergeRequests:
+    def test_merges_all_merge_requests(self):
+        bot = make_bot(batch=False)
+        merge_requests = [Mock(), Mock(), Mock()]
+        with patch.object(bot_module.Bot, '_get_single_job') as get_single_job:
+            bot._process_merge_requests(Mock(), Mock(), merge_requests)
+        assert [call[1]['merge_request'] for call in get_single_job.call_args_list] == merge_requests
+        assert get_single_job.return_value.execute.call_count == 3
+
+    def test_stops_when_embargo_starts(self):
+        bot = make_bot(batch=False)
+        merge_requests = [Mock(), Mock(), Mock()]
+        with patch.object(bot_module.Bot, '_get_single_job') as get_single_job, \
+                patch.object(bot_module.Bot, '_during_merge_embargo', side_effect=[False, True]):
+            bot._process_merge_requests(Mock(), Mock(), merge_requests)
+        assert [call[1]['merge_request'] for call in get_single_job.call_args_list] == merge_requests[:1]
+
+
+def test_fetch_projects_filters_by_project_regexp():
+    bot = make_bot(project_regexp=re.compile('(?!exclude/me)'))
+    kept = Mock(path_with_namespace='keep/me')
+    excluded = Mock(path_with_namespace='exclude/me')
+    with patch.object(bot_module.Project, 'fetch_all_mine', return_value=[kept, excluded]) as fetch_all_mine:
+        assert bot._fetch_projects() == [kept]
+    fetch_all_mine.assert_called_once_with(bot.api, search=None)
+
+
+@pytest.mark.parametrize('level', [logging.DEBUG, logging.INFO])
+def test_get_projects_at_any_log_level(caplog, level):
+    bot = make_bot(project_regexp=re.compile('(?!exclude/me)'))
+    kept = Mock(path_with_namespace='keep/me')
+    excluded = Mock(path_with_namespace='exclude/me')
+    with patch.object(bot_module.Project, 'fetch_all_mine', return_value=[kept, excluded]), \
+            caplog.at_level(level):
+        assert bot._get_projects() == [kept]
+    debug_logged = "Projects that do not match project_regexp: ['exclude/me']" in caplog.text
+    assert debug_logged == (level == logging.DEBUG)
+
+
+class TestStop:
+    def test_does_nothing_once_stopped(self):
+        bot = make_bot(cli=False)
+        bot.stop()
+        with patch.object(bot_module.Bot, '_process_projects') as process_projects:
+            bot._run(Mock())
+        process_projects.assert_not_called()
+
+    def test_stop_interrupts_sleep(self):
+        bot = make_bot(cli=False)
+        bot._polling_interval_in_secs = bot_module.Bot.MAX_POLLING_INTERVAL_IN_SECS
+
+        def process_projects_and_stop(*_args):
+            bot.stop()
+            return False
+
+        with patch.object(bot_module.Bot, '_get_projects', return_value=[]), \
+                patch.object(bot_module.Bot, '_process_projects', side_effect=process_projects_and_stop):
+            started = time.monotonic()
+            bot._run(Mock())
+        assert time.monotonic() - started < 10
+
+    def test_jobs_share_the_stop_event(self):
+        bot = make_bot()
+        job = bot._get_single_job(
+            project=Mock(), merge_request=Mock(), repo=Mock(), options=bot_module.MergeJobOptions.default(),
+        )
+        assert job._stop is bot._stop
@@ -1,3 +1,7 @@
+from unittest.mock import Mock, patch
+
+import pytest
+
 import marge.gitlab as gitlab
 
 
@@ -11,3 +15,40 @@ class TestVersion:
     def test_is_ee(self):
         assert gitlab.Version.parse('9.4.0-ee').is_ee
         assert not gitlab.Version.parse('9.4.0').is_ee
+
+
+class TestApi:
+    def test_retries_when_rate_limited(self):
+        api = gitlab.Api('http://foo.com', 'TOKEN')
+        rate_limited = Mock(status_code=429, headers={'Retry-After': '3'})
+        ok_response = Mock(status_code=200, headers={})
+        ok_response.json.return_value = {'version': '11.6.0-ce'}
+        with patch('requests.Session.get', autospec=True, side_effect=[rate_limited, ok_response]) as get, \
+                patch('time.sleep') as sleep:
+            assert api.version() == gitlab.Version(release=(11, 6, 0), edition='ce')
+        assert get.call_count == 2
+        sleep.assert_called_once_with(3)
+
+    def test_gives_up_when_rate_limited_for_too_long(self):
+        api = gitlab.Api('http://foo.com', 'TOKEN')
+        rate_limited = Mock(status_code=429, headers={})
+        rate_limited.json.return_value = {'message': '429 Too Many Requests'}
+        with patch('requests.Session.get', autospec=True, return_value=rate_limited) as get, \
+                patch('time.sleep') as sleep:
+            with pytest.raises(gitlab.TooManyRequests):
+                api.version()
+        assert get.call_count == gitlab.Api.MAX_RATE_LIMIT_RETRIES + 1
+        sleep.assert_called_with(gitlab.Api.DEFAULT_RETRY_AFTER_IN_SECS)
+
+    def test_reuses_cached_body_when_not_modified(self):
+        api = gitlab.Api('http://foo.com', 'TOKEN')
+        ok_response = Mock(status_code=200, headers={'ETag': 'W/"1234"'}, content=b'{"version": "11.6.0-ce"}')
+        ok_response.json.return_value = {'version': '11.6.0-ce'}
+        not_modified = Mock(status_code=304, headers={})
+        with patch('requests.Session.get', autospec=True, side_effect=[ok_response, not_modified]) as get:
+            assert api.version() == gitlab.Version(release=(11, 6, 0), edition='ce')
+            assert api.version() == gitlab.Version(release=(11, 6, 0), edition='ce')
+        # both requests went through the same (connection pooling) session
+        assert get.call_args_list[0][0][0] is get.call_args_list[1][0][0]
+        assert 'If-None-Match' not in get.call_args_list[0][1]['headers']
+        assert get.call_args_list[1][1]['headers']['If-None-Match'] == 'W/"1234"'
@@ -1,4 +1,4 @@
-from datetime import time
+from datetime import time, timedelta
 
 import maya
 import pendulum
@@ -108,3 +108,30 @@ class TestIntervalUnion:
             "Mon 10:00 Europe/London - Fri 18:00 Europe/London,"
             "Sat 12:00 Europe/London - Sun 09:00 Europe/London"
         ) == interval
+
+    def test_time_until_uncovered(self):
+        weekly_1 = WeeklyInterval('Mon', time(10, 00), 'Fri', time(18, 00))
+        weekly_2 = WeeklyInterval('Sat', time(12, 00), 'Sun', time(9, 00))
+        interval = IntervalUnion([weekly_1, weekly_2])
+        assert interval.time_until_uncovered(date('Saturday 9am')) == timedelta(0)
+        assert interval.time_until_uncovered(date('Friday 6pm')) == timedelta(microseconds=1)
+        assert interval.time_until_uncovered(date('Friday 5pm')) == timedelta(hours=1, microseconds=1)
+        assert interval.time_until_uncovered(date('Sunday 8am')) == timedelta(hours=1, microseconds=1)
+
+    def test_time_until_uncovered_with_overlaps(self):
+        weekly_1 = WeeklyInterval('Mon', time(10, 00), 'Fri', time(18, 00))
+        weekly_2 = WeeklyInterval('Sat', time(12, 00), 'Mon', time(11, 00))
+        interval = IntervalUnion([weekly_1, weekly_2])
+        # the Sat-Mon interval ends in the middle of the Mon-Fri one, so it isn't a way out
+        assert interval.time_until_uncovered(date('Monday 9am')) == timedelta(
+            days=4, hours=9, microseconds=1
+        )
+        assert interval.time_until_uncovered(date('Saturday 1pm')) == timedelta(
+            days=6, hours=5, microseconds=1
+        )
+
+    def test_time_until_uncovered_when_always_covered(self):
+        weekly_1 = WeeklyInterval('Mon', time(0, 00), 'Fri', time(12, 00))
+        weekly_2 = WeeklyInterval('Fri', time(11, 00), 'Mon', time(1, 00))
+        interval = IntervalUnion([weekly_1, weekly_2])
+        assert interval.time_until_uncovered(date('Tuesday 3pm')) is None
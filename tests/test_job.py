@@ -1,4 +1,5 @@
 # pylint: disable=protected-access
+import threading
 from datetime import timedelta
 from unittest.mock import ANY, Mock, patch, create_autospec
 
@@ -188,6 +189,30 @@ class TestJob:
             local=ANY,
         )
 
+    def test_sleep_waits_on_stop_event(self):
+        stop = threading.Event()
+        merge_job = self.get_merge_job(stop=stop)
+        with patch('time.sleep') as sleep, patch.object(stop, 'wait', return_value=False) as wait:
+            merge_job.sleep(5)
+        wait.assert_called_once_with(5)
+        sleep.assert_not_called()
+
+    def test_sleep_gives_up_once_stopped(self):
+        stop = threading.Event()
+        stop.set()
+        merge_job = self.get_merge_job(stop=stop)
+        with pytest.raises(SkipMerge):
+            merge_job.sleep(60)
+
+    def test_wait_for_ci_gives_up_once_stopped(self):
+        stop = threading.Event()
+        stop.set()
+        merge_job = self.get_merge_job(stop=stop)
+        merge_request = self._mock_merge_request()
+        with patch.object(MergeJob, 'get_mr_ci_status', return_value='running'):
+            with pytest.raises(SkipMerge):
+                merge_job.wait_for_ci_to_pass(merge_request, commit_sha='abc')
+
 
 class TestMergeJobOptions:
     def test_default(self):
@@ -1,4 +1,4 @@
-from unittest.mock import call, Mock
+from unittest.mock import call, patch, Mock
 
 import pytest
 
@@ -214,6 +214,34 @@ class TestMergeRequest:
         ))
         assert [mr.info for mr in result] == [mr1, mr2]
 
+    def test_fetch_all_open_assigned_to_me(self):
+        api = self.api
+        mr1, mr_not_me, mr2 = INFO, dict(INFO, assignees=[{'id': _MARGE_ID+1}], id=679), dict(INFO, id=678)
+        user = marge.user.User(api=None, info=dict(USER_INFO, id=_MARGE_ID))
+        mr_elsewhere = dict(INFO, id=680, project_id=5678)
+        api.collect_all_pages = Mock(return_value=[mr1, mr_not_me, mr_elsewhere, mr2])
+        result = MergeRequest.fetch_all_open_assigned_to_me(
+            user=user, api=api, merge_order='updated_at', project_ids={1234},
+        )
+        api.collect_all_pages.assert_called_once_with(GET(
+            '/merge_requests',
+            {'scope': 'assigned_to_me', 'state': 'opened', 'order_by': 'updated_at', 'sort': 'asc'},
+        ))
+        assert list(result) == [1234]
+        assert [mr.info for mr in result[1234]] == [mr1, mr2]
+
+    def test_fetch_assigned_to_me_skips_other_projects(self):
+        api = self.api
+        mr_wanted, mr_elsewhere = INFO, dict(INFO, id=680, project_id=5678)
+        user = marge.user.User(api=None, info=dict(USER_INFO, id=_MARGE_ID))
+        api.collect_all_pages = Mock(return_value=[mr_wanted, mr_elsewhere])
+        with patch.object(MergeRequest, 'fetch_assigned_at', return_value=1) as fetch_assigned_at:
+            result = MergeRequest.fetch_all_open_assigned_to_me(
+                user=user, api=api, merge_order='assigned_at', project_ids={1234},
+            )
+        assert list(result) == [1234]
+        fetch_assigned_at.assert_called_once_with(user, api, mr_wanted)
+
     def test_fetch_assigned_at(self):
         api = self.api
         dis1, dis2 = DISCUSSION, dict(DISCUSSION, id=679)
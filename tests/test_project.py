@@ -100,6 +100,25 @@ class TestProject:
         assert all(prj.info["permissions"]["marge"] for prj in result)
         assert all(prj.access_level == AccessLevel.developer for prj in result)
 
+    def test_fetch_all_mine_with_search(self):
+        api = self.api
+        api.collect_all_pages = Mock(return_value=[INFO])
+        api.version = Mock(return_value=Version.parse("12.0.0-ee"))
+
+        result = Project.fetch_all_mine(api, search='cool/')
+        api.collect_all_pages.assert_called_once_with(GET(
+            '/projects',
+            {
+                'membership': True,
+                'with_merge_requests_enabled': True,
+                'archived': False,
+                'min_access_level': AccessLevel.developer.value,
+                'search': 'cool/',
+                'search_namespaces': True,
+            },
+        ))
+        assert [prj.info for prj in result] == [INFO]
+
     def test_properties(self):
         project = Project(api=self.api, info=INFO)
         assert project.id == 1234
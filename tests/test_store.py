@@ -1,4 +1,5 @@
 import os.path
+import subprocess
 import tempfile
 import unittest.mock as mock
 
@@ -129,3 +130,78 @@ class TestRepoManager:
 
         # shouldn't fail
         repo_manager.forget_repo(self.new_project(90, 'non/existent'))
+
+    def test_reuses_existing_clone_when_persistent(self, git_run):
+        repo_manager = marge.store.RepoManager(
+            user=self.repo_manager.user, root_dir=self.root_dir.name, ssh_key_file='/ssh/key',
+            persistent=True,
+        )
+        project = self.new_project(1234, 'some/stuff')
+        os.makedirs(os.path.join(self.root_dir.name, '1234', '.git'))
+
+        repo = repo_manager.repo_for_project(project)
+
+        assert repo.local_path == os.path.join(self.root_dir.name, '1234')
+        calls = get_git_calls(git_run)
+        assert len(calls) == 6
+        assert calls[0].endswith("git -C %s reset --hard" % repo.local_path)
+        assert calls[1].endswith("git -C %s clean -fdx" % repo.local_path)
+        assert calls[2].endswith(
+            "git -C %s remote set-url origin %s" % (repo.local_path, project.ssh_url_to_repo)
+        )
+        assert calls[3].endswith("git -C %s fetch --prune origin" % repo.local_path)
+
+    def test_cleans_up_after_interrupted_run_when_persistent(self, git_run):
+        repo_manager = marge.store.RepoManager(
+            user=self.repo_manager.user, root_dir=self.root_dir.name, ssh_key_file='/ssh/key',
+            persistent=True,
+        )
+        project = self.new_project(1234, 'some/stuff')
+        git_dir = os.path.join(self.root_dir.name, '1234', '.git')
+        os.makedirs(os.path.join(git_dir, 'rebase-merge'))
+        open(os.path.join(git_dir, 'MERGE_HEAD'), 'w').close()
+        open(os.path.join(git_dir, 'index.lock'), 'w').close()
+
+        repo = repo_manager.repo_for_project(project)
+
+        assert not os.path.exists(os.path.join(git_dir, 'index.lock'))
+        calls = get_git_calls(git_run)
+        assert calls[0].endswith("git -C %s rebase --abort" % repo.local_path)
+        assert calls[1].endswith("git -C %s merge --abort" % repo.local_path)
+        assert calls[2].endswith("git -C %s reset --hard" % repo.local_path)
+
+    def test_reclones_unusable_clone_when_persistent(self, git_run):
+        repo_manager = marge.store.RepoManager(
+            user=self.repo_manager.user, root_dir=self.root_dir.name, ssh_key_file='/ssh/key',
+            persistent=True,
+        )
+        project = self.new_project(1234, 'some/stuff')
+        os.makedirs(os.path.join(self.root_dir.name, '1234', '.git'))
+
+        def fail_to_reset(*args, **_kwargs):
+            if 'reset' in args:
+                raise subprocess.CalledProcessError(128, args)
+            return mock.DEFAULT
+        git_run.side_effect = fail_to_reset
+
+        repo = repo_manager.repo_for_project(project)
+
+        assert not os.path.exists(repo.local_path)
+        calls = get_git_calls(git_run)
+        assert "git clone --origin=origin %s %s" % (project.ssh_url_to_repo, repo.local_path) in calls[1]
+
+    def test_clones_into_stable_dir_when_persistent(self, git_run):
+        repo_manager = marge.store.RepoManager(
+            user=self.repo_manager.user, root_dir=self.root_dir.name, ssh_key_file='/ssh/key',
+            persistent=True,
+        )
+        project = self.new_project(1234, 'some/stuff')
+        os.makedirs(os.path.join(self.root_dir.name, '1234'))  # e.g. left behind by an interrupted clone
+
+        repo = repo_manager.repo_for_project(project)
+
+        assert repo.local_path == os.path.join(self.root_dir.name, '1234')
+        assert not os.path.exists(repo.local_path)
+        assert git_run.call_count == 3
+        assert "git clone --origin=origin %s %s" % (project.ssh_url_to_repo, repo.local_path) in \
+            get_git_calls(git_run)[0]